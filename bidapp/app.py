@@ -2,12 +2,21 @@
 # כולל: בחירה מרובה מהארכיון, מיזוג PDF, פתיחת HTML בלשונית
 
 from pathlib import Path
-from datetime import date, datetime
-import io, json, re, base64, uuid
+from functools import lru_cache
+from bisect import bisect_right
+from itertools import accumulate
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from datetime import date, datetime, timedelta
+import io, gzip, html, re, time, base64, uuid, copy, hashlib
 
 import streamlit as st
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
 from fpdf import FPDF
+from fpdf.enums import XPos, YPos
+from fontTools import ttLib
 from PyPDF2 import PdfMerger
 import streamlit.components.v1 as components
 
@@ -24,14 +33,22 @@ st.set_page_config(page_title="מחולל הצעות מחיר", page_icon="📄"
 
 APP_DIR = Path(__file__).parent
 
-def asset_path(filename: str) -> Path:
-    """איתור נכס (קובץ/פונט/לוגו) בתיקיה, assets/, fonts/ או בכל העץ."""
+@st.cache_resource
+def _find_asset(filename: str) -> Path:
+    """איתור נכס (קובץ/פונט/לוגו) בתיקיה, assets/, fonts/ או בכל העץ.
+    נתיב שנמצא נשמר בין ריצות; FileNotFoundError לא נשמר, כך שקובץ שיתווסף יאותר."""
     for p in [APP_DIR/filename, APP_DIR/"assets"/filename, APP_DIR/"fonts"/filename]:
         if p.exists():
             return p
     for p in APP_DIR.rglob(filename):
         return p
-    return APP_DIR/filename
+    raise FileNotFoundError(filename)
+
+def asset_path(filename: str) -> Path:
+    try:
+        return _find_asset(filename)
+    except FileNotFoundError:
+        return APP_DIR/filename
 
 LOGO_FILE = asset_path("לוגו טללים.JPG")
 FONT_PATH = asset_path("DejaVuSans.ttf")
@@ -62,12 +79,22 @@ section.main > div { direction: rtl !important; }
 # =========================
 #        HELPERS
 # =========================
+_HE_QUOTES = str.maketrans({'"': '״', "'": "׳"})
+
 def norm_he(txt: str) -> str:
     if txt is None: return ""
-    return str(txt).replace('"', '״').replace("'", "׳")
+    return str(txt).translate(_HE_QUOTES)
+
+@st.cache_resource
+def _text_caches():
+    """norm_he ו-get_display ממוטמנים ונשמרים בין ריצות — כותרות, מספרים ושמות פריטים חוזרים שוב ושוב.
+    lru_cache ברמת המודול היה נבנה מחדש בכל rerun של Streamlit."""
+    return lru_cache(maxsize=8192)(norm_he), lru_cache(maxsize=8192)(get_display)
+
+_norm_he, _bidi = _text_caches()
 
 def heb(s: str) -> str:
-    return norm_he("" if s is None else str(s))
+    return _norm_he("" if s is None else str(s))
 
 def is_blank(x) -> bool:
     if x is None: return True
@@ -78,28 +105,45 @@ def is_blank(x) -> bool:
 def s(x) -> str:
     return "" if is_blank(x) else str(x)
 
+_FILENAME_BAD = str.maketrans({c: " " for c in '\\/:*?"\'<>|'})
+_UNDERSCORES = re.compile(r"_+")
+
 def safe_filename(text: str) -> str:
     text = "" if text is None else str(text)
-    text = re.sub(r"[\\/:*?\"'<>|]", " ", text)
-    text = re.sub(r"\s+", "_", text.strip())
-    text = re.sub(r"_+", "_", text)
-    return text or "מסמך"
-
-def fmt_money_or_blank(x) -> str:
-    if is_blank(x): return ""
-    try: return f"{float(x):.2f}"
-    except: return ""
-
-def fmt_qty_or_blank(x) -> str:
-    if is_blank(x): return ""
-    try: return f"{float(x):.2f}"
-    except: return ""
-
-def _to_float(sx):
-    """המרה עדינה: תומך בפסיק עשרוני. מחזיר NaN אם לא מספר."""
-    if sx is None: return float("nan")
-    try: return float(str(sx).replace(",", ".").strip())
-    except: return float("nan")
+    text = "_".join(text.translate(_FILENAME_BAD).split())
+    return _UNDERSCORES.sub("_", text) or "מסמך"
+
+def to_num(col: pd.Series) -> pd.Series:
+    """המרה עדינה של עמודה שלמה: תומך בפסיק עשרוני, NaN אם לא מספר.
+    עמודה מספרית (המקרה הרגיל מ-data_editor) מומרת ישירות, בלי מעבר דרך str."""
+    if not pd.api.types.is_numeric_dtype(col):
+        col = col.astype("string").str.replace(",", ".", regex=False).str.strip()
+    return pd.to_numeric(col, errors="coerce").astype(float)
+
+def _text_col(col: pd.Series) -> list[str]:
+    """עמודת טקסט כמו s(): None/NaN/רווחים → ""."""
+    txt = col.fillna("").astype(str)
+    return txt.where(txt.str.strip() != "", "").tolist()
+
+def _num_col(col: pd.Series) -> np.ndarray:
+    return to_num(col).to_numpy(dtype=float, na_value=np.nan)
+
+def _num_txt(arr: np.ndarray) -> list[str]:
+    """מערך מספרי כטקסט בפורמט 0.00, ריק אם לא מספר. מסכת ה-NaN מחושבת פעם אחת ב-numpy."""
+    return ["" if blank else f"{v:.2f}" for v, blank in zip(arr.tolist(), np.isnan(arr).tolist())]
+
+def item_rows(table_df: pd.DataFrame):
+    """שורות הייצוא (פריט, עלות, כמות, סה"כ, הערות) — מערכי numpy פעם אחת, בלי גישה ל-pandas בכל שורה."""
+    units = _num_col(table_df["עלות ליחידה (₪)"])
+    qtys = _num_col(table_df["כמות"])
+    return zip(_text_col(table_df["פריט"]), _num_txt(units), _num_txt(qtys),
+               _num_txt(units * qtys), _text_col(table_df["תיאור / הערות"]))
+
+def _df_cache_key(df: pd.DataFrame) -> bytes:
+    """מפתח מטמון לטבלה: שמות העמודות + hash מלא של כל השורות (בלי דגימה)."""
+    return "|".join(map(str, df.columns)).encode("utf-8") + pd.util.hash_pandas_object(df, index=True).values.tobytes()
+
+_DF_HASH = {pd.DataFrame: _df_cache_key}
 
 @st.cache_data
 def _empty_items_df():
@@ -109,81 +153,252 @@ def _empty_items_df():
 #   ARCHIVE (Always S3)
 # =========================
 import boto3
+from botocore.config import Config
 INDEX_COLUMNS = ["id","date","client","subject","total","pdf","html","items_json"]
-INDEX_KEY = "index/index.csv"
-
+# אינדקס: קובץ Parquet קטן ובלתי משתנה לכל שמירה (index/row-<id>.parquet) — אין קריאה-שינוי-כתיבה,
+# ולכן שתי שמירות במקביל לא דורסות זו את זו. הקריאה מקפלת מדי פעם את קובצי השורה לקובץ מרכזי
+# (index/index.parquet); המזהה הגבוה בו הוא סימן המים, ונקראים רק קובצי השורה שאחריו.
+# index.csv הישן נקרא רק לתאימות לאחור.
+INDEX_ROW_PREFIX = "index/row-"
+INDEX_AGG_KEY = "index/index.parquet"
+INDEX_COMPACT_MIN = 50                      # קובצי שורה שמצטברים אחרי סימן המים לפני קיפול
+INDEX_COMPACT_AGE = timedelta(minutes=10)   # לא מקפלים שמירות טריות — העלאה שעוד באמצע לא תיפול מתחת לסימן
+LEGACY_INDEX_KEY = "index/index.csv"
+AWS_BUCKET = st.secrets["aws"]["bucket"]
+
+@st.cache_resource
 def _s3():
+    """לקוח S3 יחיד לתהליך — בטוח לשימוש מכמה threads, ומאגר החיבורים נשמר בין קריאות."""
     aws = st.secrets["aws"]
     return boto3.client("s3",
         aws_access_key_id=aws["access_key"],
         aws_secret_access_key=aws["secret_key"],
         region_name=aws["region"],
+        config=Config(max_pool_connections=32, retries={"max_attempts": 3, "mode": "adaptive"}),
     )
 
+ID_FORMAT = "%Y%m%d-%H%M%S-%f"
+
 def _new_id():
-    return datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    return datetime.now().strftime(ID_FORMAT)
+
+def s3_put_bytes(key: str, data: bytes, content_type: str, content_encoding: str | None = None):
+    extra = {"ContentEncoding": content_encoding} if content_encoding else {}
+    _s3().put_object(Bucket=AWS_BUCKET, Key=key, Body=data, ContentType=content_type, **extra)
 
-def s3_put_bytes(key: str, data: bytes, content_type: str):
-    _s3().put_object(Bucket=st.secrets["aws"]["bucket"], Key=key, Body=data, ContentType=content_type)
+def gzip_bytes(data: bytes) -> bytes:
+    # HTML (CSS + לוגו ב-base64) ו-JSON נדחסים פי כמה; דפדפן/לקוח HTTP פותח לבד לפי Content-Encoding
+    return gzip.compress(data, compresslevel=6, mtime=0)
 
 def s3_get_bytes(key: str) -> bytes:
-    obj = _s3().get_object(Bucket=st.secrets["aws"]["bucket"], Key=key)
+    obj = _s3().get_object(Bucket=AWS_BUCKET, Key=key)
     return obj["Body"].read()
 
+def s3_list_keys(prefix: str, start_after: str = "") -> list[str]:
+    extra = {"StartAfter": start_after} if start_after else {}
+    pages = _s3().get_paginator("list_objects_v2").paginate(Bucket=AWS_BUCKET, Prefix=prefix, **extra)
+    return [o["Key"] for page in pages for o in page.get("Contents", [])]
+
 def s3_presigned(key: str, expires=3600):
     return _s3().generate_presigned_url(
         "get_object",
-        Params={"Bucket": st.secrets["aws"]["bucket"], "Key": key},
+        Params={"Bucket": AWS_BUCKET, "Key": key},
         ExpiresIn=expires
     )
 
-def load_index() -> pd.DataFrame:
+def _index_row_key(_id: str) -> str:
+    return f"{INDEX_ROW_PREFIX}{_id}.parquet"
+
+def _index_row_keys(mark: str) -> list[str]:
+    """קובצי השורה שאחרי סימן המים, מהחדש לישן. המזהים ברוחב קבוע וכרונולוגיים, ולכן StartAfter
+    על המפתח מדלג בדיוק על מה שכבר קופל."""
+    keys = s3_list_keys(INDEX_ROW_PREFIX, _index_row_key(mark) if mark else "")
+    return sorted(keys, reverse=True)
+
+def _read_index_parts(ex, keys: list[str]) -> list[pd.DataFrame]:
+    return [pd.read_parquet(io.BytesIO(b)) for b in ex.map(s3_get_bytes, keys)]
+
+def _read_index_agg() -> tuple[list[pd.DataFrame], str]:
+    """הקובץ המרכזי (כרשימה, ריקה אם עוד לא נוצר) וסימן המים שלו."""
+    try:
+        agg = pd.read_parquet(io.BytesIO(s3_get_bytes(INDEX_AGG_KEY)))
+    except _s3().exceptions.NoSuchKey:
+        return [], ""
+    return [agg], (agg["id"].max() if len(agg) else "")
+
+def _compact_index(agg: list[pd.DataFrame], rows: list[pd.DataFrame]):
+    """מקפל לקובץ המרכזי את קובצי השורה שנקראו וישנים מ-INDEX_COMPACT_AGE, כשיש מספיק מהם.
+    קובצי השורה לא נמחקים: שני קיפולים במקביל כותבים כל אחד תמונה שלמה עד סימן המים שלו,
+    ומה שאחרי הסימן עדיין נקרא מקובצי השורה."""
+    cutoff = (datetime.now() - INDEX_COMPACT_AGE).strftime(ID_FORMAT)
+    old = [r for r in rows if r["id"].iat[0] < cutoff]
+    if len(old) < INDEX_COMPACT_MIN:
+        return
+    buf = io.BytesIO()
+    pd.concat(agg + old, ignore_index=True).to_parquet(buf, compression="zstd", index=False)
+    try:
+        s3_put_bytes(INDEX_AGG_KEY, buf.getvalue(), "application/octet-stream")
+    except Exception:
+        pass  # הקיפול רק חוסך קריאות; הקריאה עצמה כבר הצליחה
+
+def _read_legacy_index() -> list[pd.DataFrame]:
     try:
-        data = s3_get_bytes(INDEX_KEY)
-        return pd.read_csv(io.BytesIO(data), dtype=str).fillna("")
+        data = s3_get_bytes(LEGACY_INDEX_KEY)
+    except _s3().exceptions.NoSuchKey:
+        return []
+    # pyarrow: פענוח מהיר בהרבה, וכל העמודות כטקסט בלי NaN (אין צורך ב-fillna)
+    table = pacsv.read_csv(pa.py_buffer(data), convert_options=pacsv.ConvertOptions(
+        column_types={c: pa.string() for c in INDEX_COLUMNS}, strings_can_be_null=False))
+    return [table.to_pandas()]
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _read_index() -> pd.DataFrame:
+    """האינדקס מ-S3: הקובץ המרכזי + קובצי השורה שאחריו (במקביל), שמור בין ריצות; archive_save
+    מנקה את המטמון אחרי כתיבה. מספר הקריאות חסום בזכות הקיפול ולא גדל עם הארכיון."""
+    agg, mark = _read_index_agg()
+    with ThreadPoolExecutor(max_workers=16) as ex:
+        rows = _read_index_parts(ex, _index_row_keys(mark))
+    _compact_index(agg, rows)
+    frames = _read_legacy_index() + agg + rows
+    if not frames:
+        return pd.DataFrame(columns=INDEX_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _read_recent_index(n: int) -> pd.DataFrame:
+    """n ההצעות האחרונות: לכל היותר n קובצי שורה חדשים, ומעבר להם הקובץ המרכזי — בלי קובצי שורה ישנים."""
+    agg, mark = _read_index_agg()
+    keys = _index_row_keys(mark)[:n]
+    with ThreadPoolExecutor(max_workers=16) as ex:
+        frames = _read_index_parts(ex, keys) + agg
+    if sum(len(f) for f in frames) < n:
+        frames += _read_legacy_index()
+    if not frames:
+        return pd.DataFrame(columns=INDEX_COLUMNS)
+    recent = pd.concat(frames, ignore_index=True).sort_values("id", ascending=False).head(n)
+    return recent.reset_index(drop=True)
+
+INDEX_SESSION_TTL = 60  # שניות
+
+def _session_index(key: str, arg, read) -> pd.DataFrame:
+    """האינדקס נשמר ב-session: cache_data מחזיר עותק חדש (unpickle) בכל קריאה, כאן אותו DataFrame
+    משמש את כל הריצות עד שפג התוקף. השינוי המותר היחיד הוא הוספת שורות דרך _session_index_append
+    (אחרי archive_save); כל memo שנגזר מהטבלה (search_index, archive_view) חייב לכלול את len() במפתח."""
+    hit = st.session_state.get(key)
+    if hit is not None and hit[1] == arg and time.monotonic() - hit[0] < INDEX_SESSION_TTL:
+        return hit[2]
+    # שגיאות לא נשמרות במטמון — הקריאה הבאה תנסה שוב
+    try:
+        df = read()
     except Exception:
         return pd.DataFrame(columns=INDEX_COLUMNS)
+    st.session_state[key] = (time.monotonic(), arg, df)
+    return df
+
+def _session_index_append(row: dict):
+    """השורה החדשה נכנסת ישירות לעותקי ה-session — בלי לקרוא שוב את האינדקס מ-S3 אחרי שמירה."""
+    values = [row[c] for c in INDEX_COLUMNS]
+    for key in ("_index_full", "_index_recent"):
+        hit = st.session_state.get(key)
+        if hit is not None:
+            df = hit[2]
+            df.loc[len(df)] = values
 
-def save_index(df: pd.DataFrame):
-    buf = io.StringIO()
-    df.to_csv(buf, index=False, encoding="utf-8")
-    s3_put_bytes(INDEX_KEY, buf.getvalue().encode("utf-8"), "text/csv")
+def load_index() -> pd.DataFrame:
+    return _session_index("_index_full", None, _read_index)
+
+def load_recent_index(n: int = 50) -> pd.DataFrame:
+    return _session_index("_index_recent", n, lambda: _read_recent_index(n))
+
+def search_index(q: str) -> pd.DataFrame:
+    """חיפוש בכל הארכיון לפי לקוח/נושא: מילולי (לא regex) ולא תלוי רישיות.
+    העמודות באותיות קטנות נשמרות ב-session ומחושבות מחדש רק כשהאינדקס מתחלף או גדל."""
+    idx = load_index()
+    if idx.empty:
+        return idx
+    lc = st.session_state.get("_index_lc")
+    if lc is None or lc[0] is not idx or lc[1] != len(idx):
+        lc = (idx, len(idx), idx["client"].str.lower(), idx["subject"].str.lower())
+        st.session_state["_index_lc"] = lc
+    ql = q.strip().lower()
+    mask = lc[2].str.contains(ql, regex=False, na=False) | lc[3].str.contains(ql, regex=False, na=False)
+    return idx[mask]
+
+def archive_view(q: str, limit: int):
+    """הטבלה שבסרגל הצד + תוויות הבחירה ומיפוי תווית→שורה. נשמר ב-session ונבנה מחדש רק כשהשאילתה,
+    המגבלה או האינדקס עצמו משתנים — הקלדה בטופס הראשי לא ממיינת ולא בונה תוויות מחדש."""
+    ql = q.strip().lower()
+    base = load_index() if ql else load_recent_index(limit)
+    sig = (ql, limit, len(base))
+    hit = st.session_state.get("_archive_view")
+    if hit is not None and hit[0] is base and hit[1] == sig:
+        return hit[2]
+    idx = search_index(ql) if ql else base
+    view = idx.sort_values("id", ascending=False) if not idx.empty else idx
+    options = (view["date"] + " · " + view["client"] + " · " + view["subject"] + " · " + view["total"] + "₪").tolist()
+    # תווית כפולה (הצעה מתוקנת שנשמרה שוב) ממופה להופעה הראשונה — החדשה ביותר, כמו options.index
+    label_pos = {}
+    for i, label in enumerate(options):
+        label_pos.setdefault(label, i)
+    result = (view, options, label_pos, not ql and len(base) >= limit)
+    st.session_state["_archive_view"] = (base, sig, result)
+    return result
+
+def append_index_row(row: dict):
+    """שורת אינדקס כקובץ Parquet משלה — כתיבה אחת בלי לקרוא דבר, ושמירות מקבילות לא מאבדות שורות."""
+    buf = io.BytesIO()
+    pd.DataFrame([row], columns=INDEX_COLUMNS).to_parquet(buf, compression="zstd", index=False)
+    s3_put_bytes(_index_row_key(row["id"]), buf.getvalue(), "application/octet-stream")
 
 def archive_save(client_name, subject_text, the_date, total, pdf_bytes, html_bytes, items_df):
-    idx = load_index().copy()
     _id = _new_id()
-    def _safe(x):
-        x = "" if x is None else str(x)
-        x = re.sub(r"[\\/:*?\"'<>|]", " ", x)
-        x = re.sub(r"\s+", "_", x.strip())
-        x = re.sub(r"_+", "_", x)
-        return x or "מסמך"
-    sc, ss = _safe(client_name), _safe(subject_text)
+    sc, ss = safe_filename(client_name), safe_filename(subject_text)
     base = f"{_id}_{sc}" + (f"_{ss}" if ss else "")
     pdf_key  = f"proposals/{base}.pdf"
     html_key = f"proposals/{base}.html"
     json_key = f"proposals/{base}.json"
-    if pdf_bytes:  s3_put_bytes(pdf_key,  pdf_bytes, "application/pdf")
-    if html_bytes: s3_put_bytes(html_key, html_bytes, "text/html")
-    rows = items_df.to_dict(orient="records")
-    s3_put_bytes(json_key, json.dumps({"items": rows}, ensure_ascii=False, indent=2).encode("utf-8"), "application/json")
+    # כותב ה-JSON של pandas (C) ישירות, בלי dict ביניים; ערכים חסרים נכתבים כ-null ולא NaN
+    items_json = '{"items":' + items_df.to_json(orient="records", force_ascii=False) + '}'
+    uploads = [(json_key, gzip_bytes(items_json.encode("utf-8")), "application/json", "gzip")]
+    if pdf_bytes:  uploads.append((pdf_key,  pdf_bytes, "application/pdf"))
+    if html_bytes: uploads.append((html_key, gzip_bytes(html_bytes), "text/html", "gzip"))
+    # הקבצים עולים במקביל; שורת האינדקס נכתבת רק אחרי שכולם הצליחו.
+    # בלי with: היציאה מ-with ממתינה לכל ההעלאות גם אחרי כישלון. כאן מבטלים את מה שעוד לא התחיל וזורקים מיד.
+    ex = ThreadPoolExecutor(max_workers=len(uploads))
+    try:
+        done, _ = wait([ex.submit(s3_put_bytes, *u) for u in uploads], return_when=FIRST_EXCEPTION)
+        for fut in done:
+            fut.result()
+    except BaseException:
+        ex.shutdown(wait=False, cancel_futures=True)
+        raise
+    ex.shutdown(wait=True)
     row = {
         "id": _id,
-        "date": pd.to_datetime(the_date).strftime("%Y-%m-%d"),
+        "date": the_date.isoformat(),
         "client": str(client_name or ""),
         "subject": str(subject_text or ""),
-        "total": f"{float(total):.2f}",
+        "total": f"{total:.2f}",
         "pdf":  pdf_key,
         "html": html_key,
         "items_json": json_key,
     }
-    idx = pd.concat([idx, pd.DataFrame([row])], ignore_index=True)
-    save_index(idx)
+    append_index_row(row)
+    _read_index.clear()
+    _read_recent_index.clear()
+    _session_index_append(row)
     return row
 
+@st.cache_data(show_spinner=False, max_entries=64)
 def READ_BYTES(key: str) -> bytes:
+    """קובץ מהארכיון. המפתחות כוללים את מזהה השמירה ולא נדרסים, לכן אפשר לשמור לפי מפתח בלבד."""
     return s3_get_bytes(key)
 
+@st.cache_data(show_spinner=False, ttl=1800)
+def archive_link(key: str) -> str:
+    """קישור חתום לשעה לקובץ בארכיון, נשמר לחצי מתוקפו — לא חותמים מחדש בכל ריצה."""
+    return s3_presigned(key, expires=3600)
+
 def merge_pdfs_bytes(list_of_pdf_bytes: list[bytes]) -> bytes:
     """מיזוג מספר PDFs לבייטים של קובץ יחיד."""
     merger = PdfMerger()
@@ -197,7 +412,7 @@ def merge_pdfs_bytes(list_of_pdf_bytes: list[bytes]) -> bytes:
 def open_current_html_in_new_tab(html_bytes: bytes) -> str:
     """מעלה HTML זמני ל-S3 ומחזיר קישור חתום לשעה."""
     key = f"temp/{uuid.uuid4().hex}.html"
-    s3_put_bytes(key, html_bytes, "text/html")
+    s3_put_bytes(key, gzip_bytes(html_bytes), "text/html", "gzip")
     return s3_presigned(key, expires=3600)
 
 # =========================
@@ -209,51 +424,57 @@ sig_contact = st.sidebar.text_input("סלולרי או מייל", "050-0000000")
 sig_company = st.sidebar.text_input("חברה", "טללים חוויות חינוכיות")
 
 st.sidebar.markdown("---")
-st.sidebar.subheader("📚 הצעות קודמות")
-
-idx = load_index()
-q = st.sidebar.text_input("חיפוש (לקוח/נושא):", "")
-if q.strip() and not idx.empty:
-    mask = (idx["client"].str.contains(q, case=False)) | (idx["subject"].str.contains(q, case=False))
-    idx_view = idx[mask].copy()
-else:
-    idx_view = idx.copy()
-if not idx_view.empty:
-    idx_view = idx_view.sort_values("id", ascending=False)
-
-if not idx_view.empty:
-    options = [
-        f"{r['date']} · {r['client']} · {r['subject']} · {r['total']}₪"
-        for _, r in idx_view.iterrows()
-    ]
-    picked = st.sidebar.multiselect("בחר הצעות (אפשר כמה):", options, default=[])
-
-    if picked:
-        rows = [idx_view.iloc[options.index(x)] for x in picked]
-
-        # מזג ל-PDF אחד
-        if st.sidebar.button("🧩 מזג PDFs להורדה", use_container_width=True):
-            blobs = [READ_BYTES(r["pdf"]) for r in rows if str(r.get("pdf") or "").strip()]
-            if blobs:
-                merged = merge_pdfs_bytes(blobs)
-                st.sidebar.download_button(
-                    "⬇️ הורד PDF מאוחד",
-                    data=merged,
-                    file_name=f"proposals_merged_{datetime.now():%Y%m%d_%H%M}.pdf",
-                    mime="application/pdf",
-                    use_container_width=True
-                )
-            else:
-                st.sidebar.warning("לא נמצאו PDFs להצעות שנבחרו.")
-
-        # פתיחת HTML בלשונית חדשה לכל נבחרת
-        st.sidebar.markdown("**פתח HTML בלשונית חדשה:**")
-        for r in rows:
-            if str(r.get("html") or "").strip():
-                url = s3_presigned(r["html"], expires=3600)
-                st.sidebar.markdown(f"- [↗ {r['date']} · {r['client']}]({url})", unsafe_allow_html=True)
-else:
-    st.sidebar.caption("אין הצעות בארכיון.")
+INDEX_PAGE = 50
+if "index_limit" not in st.session_state:
+    st.session_state["index_limit"] = INDEX_PAGE
+
+def _load_more_index():
+    st.session_state["index_limit"] += INDEX_PAGE
+
+@st.fragment
+def archive_sidebar():
+    """ארכיון ההצעות בסרגל הצד — חיפוש/בחירה/מיזוג מריצים רק את הקטע הזה, לא את כל הטופס."""
+    st.subheader("📚 הצעות קודמות")
+
+    q = st.text_input("חיפוש (לקוח/נושא):", "")
+    # עם שאילתה החיפוש עובר על כל הארכיון (האינדקס המלא נטען רק אז); בלי — רק ההצעות האחרונות
+    idx_view, options, label_pos, has_more = archive_view(q, st.session_state["index_limit"])
+
+    if not idx_view.empty:
+        picked = st.multiselect("בחר הצעות (אפשר כמה):", options, default=[])
+
+        if picked:
+            rows = [idx_view.iloc[label_pos[x]] for x in picked]
+
+            # מזג ל-PDF אחד
+            if st.button("🧩 מזג PDFs להורדה", use_container_width=True):
+                blobs = [READ_BYTES(r["pdf"]) for r in rows if str(r.get("pdf") or "").strip()]
+                if blobs:
+                    merged = merge_pdfs_bytes(blobs)
+                    st.download_button(
+                        "⬇️ הורד PDF מאוחד",
+                        data=merged,
+                        file_name=f"proposals_merged_{datetime.now():%Y%m%d_%H%M}.pdf",
+                        mime="application/pdf",
+                        use_container_width=True
+                    )
+                else:
+                    st.warning("לא נמצאו PDFs להצעות שנבחרו.")
+
+            # פתיחת HTML בלשונית חדשה לכל נבחרת
+            st.markdown("**פתח HTML בלשונית חדשה:**")
+            for r in rows:
+                if str(r.get("html") or "").strip():
+                    url = archive_link(r["html"])
+                    st.markdown(f"- [↗ {r['date']} · {r['client']}]({url})", unsafe_allow_html=True)
+
+        if has_more:
+            st.button("טען עוד הצעות", use_container_width=True, on_click=_load_more_index)
+    else:
+        st.caption("אין הצעות בארכיון.")
+
+with st.sidebar:
+    archive_sidebar()
 
 # =========================
 #        MAIN FORM
@@ -277,13 +498,10 @@ if "items" not in st.session_state:
 
 submitted = False
 with st.form("items_form", clear_on_submit=False):
-    base_df = st.session_state["items"].copy()
-    totals = (
-        pd.Series(base_df.get("עלות ליחידה (₪)")).map(_to_float).fillna(0) *
-        pd.Series(base_df.get("כמות")).map(_to_float).fillna(0)
-    ).round(2)
-    view_df = base_df.copy()
-    view_df["סה\"כ (₪)"] = totals
+    view_df = st.session_state["items"].copy()
+    view_df["סה\"כ (₪)"] = np.round(
+        np.nan_to_num(_num_col(view_df["עלות ליחידה (₪)"])) * np.nan_to_num(_num_col(view_df["כמות"])), 2
+    )
 
     edited = st.data_editor(
         view_df,
@@ -300,6 +518,8 @@ with st.form("items_form", clear_on_submit=False):
         hide_index=True,
         use_container_width=True,
     )
+    # ההנחה בתוך הטופס: שינוי שלה לא מריץ את הסקריפט עד הלחיצה על "עדכן"
+    discount_val = st.number_input("הנחה (₪)", value=0.0, min_value=0.0, step=50.0, format="%.2f")
     submitted = st.form_submit_button("עדכן טבלה", use_container_width=True)
 
 # מעדכן את ה-Session רק בלחיצה על הכפתור
@@ -308,12 +528,13 @@ if submitted:
 
 # -------- סכומים (מחושבים אחרי העריכה) --------
 calc = st.session_state["items"].copy()
-calc["עלות ליחידה (₪)"] = calc["עלות ליחידה (₪)"].map(_to_float)
-calc["כמות"] = calc["כמות"].map(_to_float)
-calc["שדה_סהכ"] = calc["עלות ליחידה (₪)"].fillna(0) * calc["כמות"].fillna(0)
-subtotal = float(calc["שדה_סהכ"].sum())
+# כל עמודה מומרת פעם אחת למערך float; אותם מערכים משמשים גם את הטבלה לייצוא וגם את הסכום
+units = _num_col(calc["עלות ליחידה (₪)"])
+qtys = _num_col(calc["כמות"])
+calc["עלות ליחידה (₪)"] = units
+calc["כמות"] = qtys
+subtotal = float(np.nansum(units * qtys))
 
-discount_val = st.number_input("הנחה (₪)", value=0.0, min_value=0.0, step=50.0, format="%.2f")
 grand_total = max(subtotal - float(discount_val or 0), 0.0)
 st.metric("סה\"כ לתשלום", f"{grand_total:,.2f} ₪")
 
@@ -341,49 +562,50 @@ html, body { direction: rtl; text-align: right; font-family: Arial, Helvetica, s
 </style>
 """
 
+def _logo_stamp():
+    """(mtime, size) של הלוגו, או None אם אין קובץ — stat אחד במקום exists()+stat()."""
+    try:
+        info = LOGO_FILE.stat()
+    except OSError:
+        return None
+    return info.st_mtime, info.st_size
+
+@st.cache_resource
+def _logo_bytes(path_str: str, stamp: tuple) -> bytes:
+    """בייטים של הלוגו — נקרא מהדיסק רק כשהקובץ משתנה; משותף ל-HTML ול-PDF."""
+    return Path(path_str).read_bytes()
+
+def logo_bytes() -> bytes | None:
+    stamp = _logo_stamp()
+    return _logo_bytes(str(LOGO_FILE), stamp) if stamp else None
+
+@st.cache_resource
+def _logo_tag(path_str: str, stamp: tuple) -> str:
+    """תגית <img> עם data URI — מקודד ל-base64 רק כשהקובץ משתנה (cache_resource: בלי העתקה בכל קריאה)."""
+    b64 = base64.b64encode(_logo_bytes(path_str, stamp)).decode("ascii")
+    ext = Path(path_str).suffix.lower().strip(".")
+    mime = "jpeg" if ext in ("jpg","jpeg") else ext
+    return f"<img class='logo' src='data:image/{mime};base64,{b64}'/>"
+
 def logo_data_tag():
-    if LOGO_FILE.exists():
-        b64 = base64.b64encode(LOGO_FILE.read_bytes()).decode("ascii")
-        ext = LOGO_FILE.suffix.lower().strip(".")
-        mime = "jpeg" if ext in ("jpg","jpeg") else ext
-        return f"<img class='logo' src='data:image/{mime};base64,{b64}'/>"
-    return ""
+    stamp = _logo_stamp()
+    return _logo_tag(str(LOGO_FILE), stamp) if stamp else ""
 
-def build_html_doc(client_name, subject_text, table_df, discount, total,
-                   sig_name, sig_contact, sig_company, the_date, extra_notes=""):
-    rows = []
-    for _, r in table_df.iterrows():
-        name = s(r.get('פריט',''))
-        unit = r.get('עלות ליחידה (₪)')
-        qty = r.get('כמות')
-        note = s(r.get('תיאור / הערות','')).replace('\n','<br>')
-        unit_txt = fmt_money_or_blank(unit)
-        qty_txt = fmt_qty_or_blank(qty)
-        tot_txt = ""
-        try:
-            if not is_blank(unit) and not is_blank(qty):
-                tot_txt = f"{float(unit)*float(qty):.2f}"
-        except Exception:
-            tot_txt = ""
-        rows.append(f"""
+ROW_TMPL = """
         <tr>
           <td>{name}</td>
-          <td class="num">{unit_txt}</td>
-          <td class="num">{qty_txt}</td>
-          <td class="num">{tot_txt}</td>
+          <td class="num">{u}</td>
+          <td class="num">{q}</td>
+          <td class="num">{t}</td>
           <td>{note}</td>
-        </tr>""")
-    html = f"""<!doctype html><html lang="he" dir="rtl"><meta charset="utf-8">{HTML_CSS}
+        </tr>"""
+
+# החלקים הקבועים של המסמך (CSS וכותרת הטבלה) נבנים פעם אחת, לא בכל קריאה
+HTML_PRELUDE = f"""<!doctype html><html lang="he" dir="rtl"><meta charset="utf-8">{HTML_CSS}
 <body>
 <div class="shell">
-  <div class="card header">
-    <div class="date">{the_date.strftime('%d.%m.%Y')}</div>
-    <div class="logo-wrap">{logo_data_tag()}</div>
-  </div>
-  <div class="card">
-    <div class="subtle">שם לקוח: {s(client_name) or '—'}</div>
-    <div class="title">הצעת מחיר{': ' + s(subject_text) if s(subject_text) else ''}</div>
-  </div>
+"""
+HTML_THEAD = """
   <div class="card">
     <table class="table" dir="rtl">
       <thead>
@@ -392,7 +614,27 @@ def build_html_doc(client_name, subject_text, table_df, discount, total,
         </tr>
       </thead>
       <tbody>
-        {''.join(rows)}
+        """
+
+@st.cache_data(show_spinner=False, max_entries=32, hash_funcs=_DF_HASH)
+def build_html_doc(client_name, subject_text, table_df, discount, total,
+                   sig_name, sig_contact, sig_company, the_date, extra_notes="", logo_stamp=None):
+    # logo_stamp (_logo_stamp()) רק כמפתח מטמון: החלפת הלוגו מבטלת מסמכים שמורים עם הלוגו הישן
+    # כל טקסט חופשי מוברח (html.escape) לפני ההצבה — תו כמו < לא ישבור את המסמך
+    e = lambda v: html.escape(s(v))
+    client, subject = e(client_name), e(subject_text)
+    rows_html = "".join([ROW_TMPL.format(name=html.escape(name), u=u, q=q, t=t,
+                                         note=html.escape(note).replace("\n", "<br>"))
+                         for name, u, q, t, note in item_rows(table_df)])
+    head = f"""  <div class="card header">
+    <div class="date">{the_date.strftime('%d.%m.%Y')}</div>
+    <div class="logo-wrap">{logo_data_tag()}</div>
+  </div>
+  <div class="card">
+    <div class="subtle">שם לקוח: {client or '—'}</div>
+    <div class="title">הצעת מחיר{': ' + subject if subject else ''}</div>
+  </div>"""
+    tail = f"""
       </tbody>
     </table>
     <div class="total">סה&quot;כ לתשלום: {total:,.2f} ₪</div>
@@ -401,27 +643,58 @@ def build_html_doc(client_name, subject_text, table_df, discount, total,
   <div class="card">
     <div style="font-weight:700;">תנאים והערות</div>
     <div>המחירים כוללים מע&quot;מ.</div>
-    {f'<div style="margin-top:6px; white-space:pre-line;">{extra_notes}</div>' if (extra_notes or '').strip() else ''}
+    {f'<div style="margin-top:6px; white-space:pre-line;">{e(extra_notes)}</div>' if (extra_notes or '').strip() else ''}
   </div>
   <div class="card sign">
     <div class="divider"></div>
-    בברכה,<br>{s(sig_name)}<br>{s(sig_contact)}<br>{s(sig_company)}
+    בברכה,<br>{e(sig_name)}<br>{e(sig_contact)}<br>{e(sig_company)}
   </div>
 </div>
 </body></html>"""
-    return html
+    return "".join([HTML_PRELUDE, head, HTML_THEAD, rows_html, tail])
 
 # =========================
 #         PDF EXPORT
 # =========================
 class PDF(FPDF):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._widths = {}
+        self.footer_date = date.today()
+
+    def text_width(self, vis: str) -> float:
+        """get_string_width ממוטמן לפי (פונט, גודל, טקסט)."""
+        key = (self.font_family, self.font_style, self.font_size_pt, vis)
+        w = self._widths.get(key)
+        if w is None:
+            w = self._widths[key] = self.get_string_width(vis)
+        return w
+
     def footer(self):
         # פוטר עדין בכל עמוד
         self.set_y(-12)
         self.set_font('DejaVu','',9)
-        txt = get_display(heb(f"{date.today():%d.%m.%Y} · עמוד {self.page_no()}"))
+        txt = _bidi(heb(f"{self.footer_date:%d.%m.%Y} · עמוד {self.page_no()}"))
         self.cell(0, 6, txt, align='C')
 
+@st.cache_resource
+def _font_prototype(font_path: str, mtime: float):
+    """DejaVu מפוענח + בייטים של הקובץ — פענוח ה-TTF נעשה פעם אחת ונשמר בין ריצות."""
+    proto = FPDF(orientation="P", unit="mm", format="A4")
+    proto.add_font('DejaVu', '', font_path)
+    return proto.fonts, Path(font_path).read_bytes()
+
+def register_hebrew_font(pdf):
+    """רישום DejaVu במסמך חדש: המטריקות משותפות, ה-TTFont חדש לכל מסמך (fpdf2 חותך אותו ב-output)."""
+    # תלוי בפנימיות של fpdf2 2.8 (לכן requirements נועל fpdf2<2.9):
+    #   - pdf.fonts ממפה שם פונט לאובייקט TTFFont, ו-TTFFont.__deepcopy__ משתף את cmap/desc/ttfont בין העותקים;
+    #   - ב-output() ‏fpdf2 חותך (subset) את TTFFont.ttfont במקום — לכן מוחלף כאן ב-TTFont חדש לכל מסמך.
+    fonts, font_bytes = _font_prototype(str(FONT_PATH), FONT_PATH.stat().st_mtime)
+    for key, font in fonts.items():
+        font = copy.deepcopy(font)
+        font.ttfont = ttLib.TTFont(io.BytesIO(font_bytes), recalcTimestamp=False, lazy=True)
+        pdf.fonts[key] = font
+
 def rtl_x_positions(pdf, col_w):
     x_right = pdf.w - pdf.r_margin
     xs, run = [], 0
@@ -430,66 +703,78 @@ def rtl_x_positions(pdf, col_w):
         xs.append(x_right - run)
     return xs
 
-def draw_table_header_rtl(pdf, headers, col_w):
-    xs = rtl_x_positions(pdf, col_w)
+def draw_table_header_rtl(pdf, headers, col_w, xs):
     pdf.set_font('DejaVu', '', 12)
     pdf.set_fill_color(238, 242, 255)
     header_h = 11
     for i, h in enumerate(headers):
         pdf.set_xy(xs[i], pdf.get_y())
-        pdf.cell(col_w[i], header_h, get_display(heb(h)), border=1, align='C', fill=True)
+        pdf.cell(col_w[i], header_h, _bidi(heb(h)), border=1, align='C', fill=True)
     pdf.ln(0.7)
 
-def ensure_page_space(pdf, h_needed, headers, col_w):
+def ensure_page_space(pdf, h_needed, headers, col_w, xs):
+    """מעבר עמוד (עם כותרת טבלה) אם אין מקום."""
     if pdf.get_y() + h_needed > (pdf.h - pdf.b_margin):
         pdf.add_page()
-        draw_table_header_rtl(pdf, headers, col_w)
+        draw_table_header_rtl(pdf, headers, col_w, xs)
 
 def wrap_text_rtl(pdf, text, max_w):
-    logical = heb(text or "")
-    words = logical.split(" ")
-    lines, cur = [], ""
-    for w in words:
-        test = w if cur == "" else (cur + " " + w)
-        vis = get_display(test)
-        if pdf.get_string_width(vis) <= max_w or cur == "":
-            cur = test
-        else:
-            lines.append(cur); cur = w
-    if cur != "": lines.append(cur)
+    """גלישת שורות חמדנית: כל מילה נמדדת פעם אחת, וסוף כל שורה נמצא בחיפוש בינארי על סכומי רוחב מצטברים."""
+    text = heb(text or "")
+    if not text:
+        return []
+    # המקרה הנפוץ: כל התא נכנס בשורה אחת — מדידה אחת (ממוטמנת) בלי לפרק למילים
+    if pdf.text_width(_bidi(text)) <= max_w:
+        return [text]
+    words = [w for w in text.split(" ") if w]
+    space_w = pdf.text_width(" ")
+    # ends[k] = רוחב k המילים הראשונות + k רווחים; המילים i..j-1 נכנסות בשורה אם ends[j] - ends[i] - space_w <= max_w
+    ends = list(accumulate((pdf.text_width(_bidi(w)) + space_w for w in words), initial=0.0))
+    lines, i = [], 0
+    while i < len(words):
+        # לפחות מילה אחת בשורה, גם אם היא לבדה רחבה מהעמודה
+        j = max(bisect_right(ends, ends[i] + space_w + max_w, i + 1) - 1, i + 1)
+        lines.append(" ".join(words[i:j]))
+        i = j
     return lines
 
 def measure_rtl_height(pdf, text, max_w, line_h):
     lines = wrap_text_rtl(pdf, text, max_w)
     return max(line_h, line_h * len(lines)), lines
 
-def draw_block_rtl(pdf, x, y, w, h, text, line_h=8, align='R', bg=None, pad_r=0.0, pad_l=1.2):
-    if bg: pdf.set_fill_color(*bg); pdf.rect(x, y, w, h, style='DF')
-    else:  pdf.rect(x, y, w, h, style='D')
-    lines = wrap_text_rtl(pdf, text or "", max_w=w - pad_l - pad_r) or [""]
+def draw_block_rtl(pdf, x, y, w, h, text, line_h=8, align='R', fill=False, pad_r=0.0, pad_l=1.2, lines=None):
+    """lines: שורות שכבר חושבו ב-measure_rtl_height — כך הגלישה לא מחושבת פעמיים לאותו תא.
+    fill: רקע בצבע המילוי הנוכחי (הקורא קובע אותו פעם אחת לשורה)."""
+    pdf.rect(x, y, w, h, style='DF' if fill else 'D')
+    if lines is None:
+        lines = wrap_text_rtl(pdf, text or "", max_w=w - pad_l - pad_r)
+    lines = lines or [""]
     for i, ln in enumerate(lines):
-        vis = get_display(heb(ln)).strip()
-        txt_w = pdf.get_string_width(vis)
+        vis = _bidi(heb(ln)).strip()
+        txt_w = pdf.text_width(vis)
         x_text = x + (w - txt_w - pad_r) if align=='R' else (x + (w - txt_w)/2.0 if align=='C' else x+pad_l)
         y_text = y + (i+1)*line_h - 1.6
         pdf.text(x_text, y_text, vis)
 
-def draw_num_block(pdf, x, y, w, h, text, bg=None):
-    if bg: pdf.set_fill_color(*bg); pdf.rect(x, y, w, h, style='DF')
-    else:  pdf.rect(x, y, w, h, style='D')
-    vis = get_display(heb((text or "").strip()))
-    txt_w = pdf.get_string_width(vis)
+def draw_num_block(pdf, x, y, w, h, text, fill=False):
+    pdf.rect(x, y, w, h, style='DF' if fill else 'D')
+    vis = _bidi(heb((text or "").strip()))
+    txt_w = pdf.text_width(vis)
     x_text = x + (w - txt_w)/2.0
     y_text = y + (h - 8)/2.0 + (8 - 1.6)
     pdf.text(x_text, y_text, vis)
 
-def build_pdf_bytes(client_name, subject_text, table_df, discount, total, the_date, extra_notes=""):
-    if not FONT_PATH.exists():
-        st.error("נדרש קובץ DejaVuSans.ttf בתיקיית האפליקציה (או fonts/).")
-        return None
-
+@st.cache_data(show_spinner=False, max_entries=32, hash_funcs=_DF_HASH)
+def build_pdf_bytes(client_name, subject_text, table_df, discount, total,
+                    sig_name, sig_contact, sig_company, the_date, extra_notes="", font_mtime=0.0,
+                    footer_date=None, logo_stamp=None):
+    """PDF של ההצעה. נשמר במטמון לפי כל הקלטים; font_mtime ו-logo_stamp נכנסים למפתח כדי שהחלפת
+    הפונט או הלוגו תבטל אותו, ו-footer_date (תאריך ההפקה שבפוטר) — כדי שמסמך שנבנה מחר לא יוגש
+    מהמטמון עם התאריך של היום."""
     pdf = PDF(orientation="P", unit="mm", format="A4")
-    pdf.add_font('DejaVu', '', str(FONT_PATH), uni=True)
+    if footer_date is not None:
+        pdf.footer_date = footer_date
+    register_hebrew_font(pdf)
     pdf.set_auto_page_break(auto=False, margin=15)
     pdf.add_page()
     pdf.set_line_width(0.2)
@@ -503,25 +788,26 @@ def build_pdf_bytes(client_name, subject_text, table_df, discount, total, the_da
     # תאריך
     pdf.set_font('DejaVu', '', 12)
     pdf.set_xy(pdf.l_margin, 9)
-    pdf.cell(0, 8, get_display(heb(the_date.strftime('%d.%m.%Y'))), align='L')
+    pdf.cell(0, 8, _bidi(heb(the_date.strftime('%d.%m.%Y'))), align='L')
 
     # לוגו
     try:
-        if LOGO_FILE.exists():
+        logo = logo_bytes()
+        if logo:
             logo_w = 36
             x_logo = pdf.w - pdf.r_margin - logo_w
-            pdf.image(str(LOGO_FILE), x=x_logo, y=6, w=logo_w)
+            pdf.image(io.BytesIO(logo), x=x_logo, y=6, w=logo_w)
     except Exception:
         pass
 
     # כותרת מסמך (multi-line שלא נחתכת)
     pdf.set_y(band_h + 6)
     pdf.set_font('DejaVu', '', 13)
-    pdf.cell(0, 8, get_display(heb(f"שם לקוח: {s(client_name)}")), ln=True, align='R')
+    pdf.cell(0, 8, _bidi(heb(f"שם לקוח: {s(client_name)}")), align='R', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
 
     pdf.set_font('DejaVu', '', 18)
     title_line = f"הצעת מחיר{': ' + s(subject_text) if s(subject_text) else ''}"
-    title_vis = get_display(heb(title_line))
+    title_vis = _bidi(heb(title_line))
     pdf.multi_cell(0, 9, title_vis, align='R')
     pdf.ln(2)
 
@@ -529,39 +815,31 @@ def build_pdf_bytes(client_name, subject_text, table_df, discount, total, the_da
     headers = ["פריט", "עלות ליחידה (₪)", "כמות", "סה\"כ (₪)", "תיאור / הערות"]
     col_w = [46, 34, 18, 28, 64]  # סך הכל 190 = רוחב הדף הפנוי
     line_h = 8.0
-    draw_table_header_rtl(pdf, headers, col_w)
+    # מיקומי העמודות תלויים רק ברוחב הדף והשוליים — מחושבים פעם אחת לכל המסמך
+    xs = rtl_x_positions(pdf, col_w)
+    draw_table_header_rtl(pdf, headers, col_w, xs)
 
+    # רוחב הטקסט בפועל בתאי הטקסט (draw_block_rtl מפחית pad_l=1.2)
+    text_w = [w - 1.2 for w in col_w]
     row_alt = False
-    for _, r in table_df.iterrows():
+    for name, unit_txt, qty_txt, tot_txt, note in item_rows(table_df):
         row_alt = not row_alt
-        bg = (250, 250, 250) if row_alt else None
-        xs = rtl_x_positions(pdf, col_w)
-
-        name = s(r.get("פריט",""))
-        unit = r.get("עלות ליחידה (₪)")
-        qty  = r.get("כמות")
-        note = s(r.get("תיאור / הערות","")).replace("\r","")
-
-        unit_txt = fmt_money_or_blank(unit)
-        qty_txt  = fmt_qty_or_blank(qty)
-        tot_txt  = ""
-        try:
-            if not is_blank(unit) and not is_blank(qty):
-                tot_txt = f"{float(unit)*float(qty):.2f}"
-        except Exception:
-            tot_txt = ""
+        note = note.replace("\r","")
 
-        y0 = pdf.get_y()
-        h_name, _ = measure_rtl_height(pdf, name, col_w[0], line_h)
-        h_note, _ = measure_rtl_height(pdf, note, col_w[4], line_h)
+        h_name, name_lines = measure_rtl_height(pdf, name, text_w[0], line_h)
+        h_note, note_lines = measure_rtl_height(pdf, note, text_w[4], line_h)
         h_row = max(line_h, h_name, h_note)
 
-        ensure_page_space(pdf, h_row, headers, col_w); y0 = pdf.get_y(); xs = rtl_x_positions(pdf, col_w)
-        draw_block_rtl(pdf, xs[0], y0, col_w[0], h_row, name, line_h=line_h, align='R', bg=bg, pad_r=0.0)
-        draw_num_block(pdf,  xs[1], y0, col_w[1], h_row, unit_txt, bg=bg)
-        draw_num_block(pdf,  xs[2], y0, col_w[2], h_row, qty_txt,  bg=bg)
-        draw_num_block(pdf,  xs[3], y0, col_w[3], h_row, tot_txt,  bg=bg)
-        draw_block_rtl(pdf, xs[4], y0, col_w[4], h_row, note, line_h=line_h, align='R', bg=bg, pad_r=0.0)
+        ensure_page_space(pdf, h_row, headers, col_w, xs)
+        # צבע הרקע נקבע פעם אחת לשורה מוצללת (אחרי מעבר עמוד, כי כותרת הטבלה משנה אותו)
+        if row_alt:
+            pdf.set_fill_color(250, 250, 250)
+        y0 = pdf.get_y()
+        draw_block_rtl(pdf, xs[0], y0, col_w[0], h_row, name, line_h=line_h, align='R', fill=row_alt, pad_r=0.0, lines=name_lines)
+        draw_num_block(pdf,  xs[1], y0, col_w[1], h_row, unit_txt, fill=row_alt)
+        draw_num_block(pdf,  xs[2], y0, col_w[2], h_row, qty_txt,  fill=row_alt)
+        draw_num_block(pdf,  xs[3], y0, col_w[3], h_row, tot_txt,  fill=row_alt)
+        draw_block_rtl(pdf, xs[4], y0, col_w[4], h_row, note, line_h=line_h, align='R', fill=row_alt, pad_r=0.0, lines=note_lines)
         pdf.set_y(y0 + h_row)
 
     # סיכום
@@ -569,34 +847,34 @@ def build_pdf_bytes(client_name, subject_text, table_df, discount, total, the_da
     pdf.set_fill_color(248, 250, 252)
     box_h = 20 if discount and discount>0 else 16
     box_w = 96
-    ensure_page_space(pdf, box_h + 10, headers, col_w)
+    ensure_page_space(pdf, box_h + 10, headers, col_w, xs)
     x = pdf.w - pdf.r_margin - box_w
     y = pdf.get_y()
     pdf.rect(x, y, box_w, box_h, style='DF')
     pdf.set_xy(x + 6, y + (4 if discount and discount>0 else 3))
     pdf.set_font('DejaVu', '', 14)
-    pdf.cell(box_w - 12, 8, get_display(heb(f"סה\"כ לתשלום: {total:,.2f} ₪")), align='R')
+    pdf.cell(box_w - 12, 8, _bidi(heb(f"סה\"כ לתשלום: {total:,.2f} ₪")), align='R')
     if discount and discount>0:
         pdf.set_xy(x + 6, y + 12)
         pdf.set_font('DejaVu', '', 11)
-        pdf.cell(box_w - 12, 6, get_display(heb(f"הנחה: -{discount:,.2f} ₪")), align='R')
+        pdf.cell(box_w - 12, 6, _bidi(heb(f"הנחה: -{discount:,.2f} ₪")), align='R')
 
     # תנאים והערות
     pdf.ln(22)
-    ensure_page_space(pdf, 30, headers, col_w)
+    ensure_page_space(pdf, 30, headers, col_w, xs)
     pdf.set_font('DejaVu', '', 12)
-    pdf.multi_cell(0, 7, get_display(heb("תנאים והערות:\nהמחירים כוללים מע״מ.")), align='R')
+    pdf.multi_cell(0, 7, _bidi(heb("תנאים והערות:\nהמחירים כוללים מע״מ.")), align='R')
     if (extra_notes or "").strip():
         pdf.ln(4)
-        pdf.multi_cell(0, 7, get_display(heb(extra_notes)), align='R')
+        pdf.multi_cell(0, 7, _bidi(heb(extra_notes)), align='R')
     pdf.ln(8)
     pdf.line(pdf.l_margin, pdf.get_y(), pdf.w - pdf.r_margin, pdf.get_y())
     pdf.ln(6)
     sig_block = f"בברכה,\n{s(sig_name)}\n{s(sig_contact)}\n{s(sig_company)}"
-    pdf.multi_cell(0, 8, get_display(heb(sig_block)), align='C')
+    pdf.multi_cell(0, 8, _bidi(heb(sig_block)), align='C')
 
-    raw = pdf.output(dest='S')
-    return raw if isinstance(raw, (bytes, bytearray)) else raw.encode('latin-1')
+    # fpdf2 מחזיר bytearray מהזיכרון — בלי קובץ זמני
+    return bytes(pdf.output())
 
 # =========================
 #     BUILD & DOWNLOAD
@@ -606,49 +884,79 @@ safe_subject = safe_filename(subject_text)
 html_name = f"הצעת_מחיר_{safe_client}_{safe_subject}.html" if safe_subject else f"הצעת_מחיר_{safe_client or 'לקוח'}.html"
 pdf_name  = f"הצעת_מחיר_{safe_client}_{safe_subject}.pdf"  if safe_subject else f"הצעת_מחיר_{safe_client or 'לקוח'}.pdf"
 
+logo_stamp = _logo_stamp()
 full_html = build_html_doc(
     client_name, subject_text, calc, discount_val, grand_total,
-    sig_name, sig_contact, sig_company, today, extra_notes
+    sig_name, sig_contact, sig_company, today, extra_notes, logo_stamp
 )
 
 pdf_ready = bool((client_name or "").strip()) and len(calc) > 0
-pdf_bytes = build_pdf_bytes(
-    client_name, subject_text, calc, discount_val, grand_total, today, extra_notes
-) if pdf_ready else None
-
-c1, c2, c3, c4 = st.columns([1,1,1,1])
-with c1:
-    st.download_button(
-        "📥 הורדה כ־HTML",
-        data=full_html.encode("utf-8"),
-        file_name=html_name, mime="text/html",
-        use_container_width=True
-    )
-with c2:
-    st.download_button(
-        "📥 הורדה כ־PDF",
-        data=(bytes(pdf_bytes) if isinstance(pdf_bytes, bytearray) else (pdf_bytes or b"")),
-        file_name=pdf_name, mime="application/pdf",
-        disabled=(pdf_bytes is None), use_container_width=True
-    )
-with c3:
-    open_url = open_current_html_in_new_tab(full_html.encode("utf-8"))
-    st.markdown(
-        f'<a href="{open_url}" target="_blank" rel="noopener" '
-        'style="display:block;text-align:center;border:1px solid #e5e7eb;'
-        'padding:0.6rem;border-radius:0.5rem;">↗ פתח HTML בלשונית חדשה</a>',
-        unsafe_allow_html=True
-    )
-with c4:
-    if st.button("💾 שמירה בארכיון", type="primary", use_container_width=True, disabled=(pdf_bytes is None)):
-        try:
-            row = archive_save(
-                client_name, subject_text, today, grand_total,
-                pdf_bytes, full_html.encode("utf-8"), calc
+if pdf_ready and not FONT_PATH.exists():
+    st.error("נדרש קובץ DejaVuSans.ttf בתיקיית האפליקציה (או fonts/).")
+    pdf_ready = False
+pdf_args = (
+    client_name, subject_text, calc, discount_val, grand_total,
+    sig_name, sig_contact, sig_company, today, extra_notes,
+    FONT_PATH.stat().st_mtime if FONT_PATH.exists() else 0.0,
+    date.today(),
+    logo_stamp,
+)
+# ה-PDF נבנה רק בלחיצה (הכנה/שמירה) ונשמר ב-session עם חתימת הקלטים — כך לא מוגשת גרסה ישנה
+pdf_key = hashlib.sha1(repr(pdf_args[:2] + pdf_args[3:]).encode("utf-8") + _df_cache_key(calc)).hexdigest()
+
+def _make_pdf() -> bytes:
+    data = build_pdf_bytes(*pdf_args)
+    st.session_state["pdf_doc"] = (pdf_key, data)
+    return data
+
+@st.fragment
+def download_buttons():
+    """הורדה/הכנת PDF/שמירה — לחיצה מריצה רק את הקטע הזה; הקלטים נלקחים מהריצה המלאה האחרונה."""
+    _pdf_doc = st.session_state.get("pdf_doc")
+    pdf_bytes = _pdf_doc[1] if _pdf_doc and _pdf_doc[0] == pdf_key else None
+
+    c1, c2, c3, c4 = st.columns([1,1,1,1])
+    with c1:
+        st.download_button(
+            "📥 הורדה כ־HTML",
+            data=full_html.encode("utf-8"),
+            file_name=html_name, mime="text/html",
+            use_container_width=True
+        )
+    with c2:
+        if pdf_bytes is None and st.button("🛠️ הכן PDF", use_container_width=True, disabled=not pdf_ready):
+            pdf_bytes = _make_pdf()
+        if pdf_bytes is not None:
+            st.download_button(
+                "📥 הורדה כ־PDF",
+                data=pdf_bytes,
+                file_name=pdf_name, mime="application/pdf",
+                use_container_width=True
+            )
+    with c3:
+        # העלאת HTML זמני ל-S3 רק לפי בקשה, לא בכל ריצה
+        if st.button("↗ פתח HTML בלשונית חדשה", use_container_width=True):
+            open_url = open_current_html_in_new_tab(full_html.encode("utf-8"))
+            st.markdown(
+                f'<a href="{open_url}" target="_blank" rel="noopener" '
+                'style="display:block;text-align:center;border:1px solid #e5e7eb;'
+                'padding:0.6rem;border-radius:0.5rem;">↗ לחץ לפתיחה</a>',
+                unsafe_allow_html=True
             )
-            st.success(f"נשמר בארכיון: {row['date']} · {row['client']} · {row['subject']}")
-        except Exception as e:
-            st.error(f"שמירה נכשלה: {e}")
+    with c4:
+        if st.button("💾 שמירה בארכיון", type="primary", use_container_width=True, disabled=not pdf_ready):
+            try:
+                if pdf_bytes is None:
+                    pdf_bytes = _make_pdf()
+                row = archive_save(
+                    client_name, subject_text, today, grand_total,
+                    pdf_bytes, full_html.encode("utf-8"), calc
+                )
+                st.success(f"נשמר בארכיון: {row['date']} · {row['client']} · {row['subject']}")
+            except Exception as e:
+                st.error(f"שמירה נכשלה: {e}")
+
+download_buttons()
 
 # תצוגה מקדימה (אופציונלי)
 with st.expander("🔎 תצוגה מקדימה (HTML)"):